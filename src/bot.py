@@ -3,16 +3,26 @@ import sys
 import json
 import logging
 import asyncio
+import tempfile
 from dataclasses import dataclass
-from pathlib import Path
+from functools import lru_cache
 from datetime import datetime, timedelta, timezone
 from typing import Callable, Optional
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 from dotenv import load_dotenv
 from telegram import Update
 from telegram.ext import Application, MessageHandler, filters, ContextTypes
 
 
+# Временные ошибки и троттлинг Object Storage повторяются с адаптивной задержкой
+BOTO_CONFIG = Config(
+    retries={"mode": "adaptive", "max_attempts": 10}, max_pool_connections=32
+)
+
+
 @dataclass
 class S3Config:
     """Configuration class for S3 connection"""
@@ -39,6 +49,7 @@ class S3Poller:
             aws_access_key_id=config.key_id,
             aws_secret_access_key=config.key_secret,
             endpoint_url=config.endpoint,
+            config=BOTO_CONFIG,
         )
         self.bucket = bucket_name
         self.prefix = prefix
@@ -49,20 +60,20 @@ class S3Poller:
         """Проверяет новые файлы, созданные за последние N минут"""
         cutoff_time = datetime.now(timezone.utc) - timedelta(minutes=since_minutes)
         new_files = []
+        seen_files = self.seen_files
 
         try:
             paginator = self.s3.get_paginator("list_objects_v2")
             pages = paginator.paginate(Bucket=self.bucket, Prefix=self.prefix)
 
             for page in pages:
-                if "Contents" not in page:
-                    continue
-
-                for obj in page["Contents"]:
-                    if obj["LastModified"] > cutoff_time:
-                        if obj["Key"] not in self.seen_files:
-                            new_files.append(obj["Key"])
-                            self.seen_files.add(obj["Key"])
+                page_files = [
+                    obj["Key"]
+                    for obj in page.get("Contents", ())
+                    if obj["LastModified"] > cutoff_time and obj["Key"] not in seen_files
+                ]
+                new_files.extend(page_files)
+                seen_files.update(page_files)
 
         except Exception as e:
             print(f"Ошибка при проверке S3: {e}")
@@ -73,9 +84,22 @@ class S3Poller:
 class S3Client:
     """S3 client class for file operations."""
 
-    def __init__(self, config: S3Config, logger):
+    def __init__(
+        self,
+        config: S3Config,
+        logger,
+        multipart_chunksize: int = 16 * 1024 * 1024,
+        max_concurrency: int = 10,
+    ):
         self.config = config
         self.logger = logger
+        # Большие файлы загружаются частями в несколько потоков
+        self.transfer_config = TransferConfig(
+            multipart_threshold=8 * 1024 * 1024,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=max_concurrency > 1,
+        )
 
         try:
             self.client = boto3.client(
@@ -83,18 +107,19 @@ class S3Client:
                 aws_access_key_id=config.key_id,
                 aws_secret_access_key=config.key_secret,
                 endpoint_url=config.endpoint,
+                config=BOTO_CONFIG,
             )
         except Exception as e:
-            self.logger.error(f"Error initializing S3 client: {e}")
+            self.logger.error("Error initializing S3 client: %s", e)
             raise
 
     def check_file_exists(self, bucket_name, file_path) -> bool:
         """Check if file exists in S3 bucket."""
         try:
-            print(file_path)
+            self.logger.debug("Checking %s", file_path)
             self.client.head_object(Bucket=bucket_name, Key=file_path)
             return True
-        except:
+        except ClientError:
             return False
 
     def upload_file(self, bucket_name, file_name) -> bool:
@@ -104,11 +129,13 @@ class S3Client:
                 raise FileNotFoundError(f"File {file_name} not found")
 
             file_size = os.path.getsize(file_name)
-            self.logger.info(f"File size to upload: {file_size} bytes")
+            self.logger.info("File size to upload: %s bytes", file_size)
 
-            self.client.upload_file(file_name, bucket_name, file_name)
+            self.client.upload_file(
+                file_name, bucket_name, file_name, Config=self.transfer_config
+            )
 
-            self.logger.info(f"File successfully uploaded to {bucket_name}/{file_name}")
+            self.logger.info("File successfully uploaded to %s/%s", bucket_name, file_name)
 
             if self.check_file_exists(bucket_name, file_name):
                 self.logger.info("Upload verification: file exists in S3")
@@ -118,21 +145,60 @@ class S3Client:
                 return False
 
         except Exception as e:
-            self.logger.error(f"Error uploading file: {e}")
+            self.logger.error("Error uploading file: %s", e)
+            raise
+
+    def upload_fileobj(self, bucket_name, file_obj, key) -> bool:
+        """Upload file-like object to S3 bucket."""
+        try:
+            self.client.upload_fileobj(
+                file_obj, bucket_name, key, Config=self.transfer_config
+            )
+
+            self.logger.info("File successfully uploaded to %s/%s", bucket_name, key)
+
+            if self.check_file_exists(bucket_name, key):
+                self.logger.info("Upload verification: file exists in S3")
+                return True
+            else:
+                self.logger.error("File not found in S3 after upload")
+                return False
+
+        except Exception as e:
+            self.logger.error("Error uploading file: %s", e)
             raise
 
     def get_response(self, bucket_name, file_path) -> str:
         """Get response from S3."""
         try:
-            print(file_path)
+            self.logger.debug("Getting %s", file_path)
             response = self.client.get_object(Bucket=bucket_name, Key=file_path)
-            object_content = response["Body"].read().decode("utf-8")
-            data = json.loads(object_content)
-            return data["report"]
+            return self._read_report(response)
         except Exception as e:
-            self.logger.error(f"Error getting response: {e}")
+            self.logger.error("Error getting response: %s", e)
             raise
 
+    def get_response_if_exists(self, bucket_name, file_path) -> Optional[str]:
+        """Get response from S3 with a single request, None if file is not there yet."""
+        try:
+            response = self.client.get_object(Bucket=bucket_name, Key=file_path)
+        except ClientError as e:
+            # Без права ListBucket отсутствующий ключ возвращается как 403
+            code = e.response.get("Error", {}).get("Code")
+            if code not in ("NoSuchKey", "404", "AccessDenied", "403"):
+                self.logger.warning("Error checking response: %s", e)
+            return None
+        except BotoCoreError as e:
+            self.logger.warning("Error checking response: %s", e)
+            return None
+        return self._read_report(response)
+
+    @staticmethod
+    def _read_report(response) -> str:
+        # json.loads разбирает UTF-8 байты сам, без промежуточной строки
+        data = json.loads(response["Body"].read())
+        return data["report"]
+
 
 # Настройка логирования
 logging.basicConfig(
@@ -140,14 +206,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Сколько документов бот обрабатывает одновременно
+MAX_CONCURRENT_UPDATES = 16
+# Bot API отдаёт боту файлы до 20 МБ, поэтому документ обычно целиком в памяти
+SPOOL_MAX_SIZE = 20 * 1024 * 1024
+
+
+@lru_cache(maxsize=None)
+def get_uploader() -> S3Client:
+    """Возвращает S3 клиент, создаваемый один раз на процесс"""
+    s3_config = S3Config(
+        key_id=os.getenv("KEY_ID"),
+        key_secret=os.getenv("KEY_SECRET"),
+        upload_bucket_name=os.getenv("UPLOAD_BUCKET_NAME"),
+    )
+    return S3Client(s3_config, logger)
+
 
 async def wait_for_file_and_get_response(uploader, filename, max_attempts=20, delay=10):
     """Асинхронно ждет появления файла и получает ответ"""
     for attempt in range(max_attempts):
-        if uploader.check_file_exists("processed-results", filename):
-            text = uploader.get_response("processed-results", filename)
+        text = await asyncio.to_thread(
+            uploader.get_response_if_exists, "processed-results", filename
+        )
+        if text is not None:
             return text
-        logger.info(f"Ожидание файла... попытка {attempt + 1}/{max_attempts}")
+        logger.info("Ожидание файла... попытка %s/%s", attempt + 1, max_attempts)
         await asyncio.sleep(delay)
 
     return "Превышено время ожидания обработки файла"
@@ -155,54 +239,50 @@ async def wait_for_file_and_get_response(uploader, filename, max_attempts=20, de
 
 async def handle_wrong_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает полученные документы."""
-    await update.message.reply_text(
-        "Не верный формат документа", reply_to_message_id=update.message.id
+    message = update.message
+    await message.reply_text(
+        "Не верный формат документа", reply_to_message_id=message.id
     )
 
 
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает полученные документы."""
+    message = update.message
     try:
         # Получаем объект файла
-        file = await update.message.document.get_file()
+        document = message.document
+        file = await document.get_file()
 
         # Формируем имя файла
-        original_filename = update.message.document.file_name
-        safe_filename = Path(original_filename).name
-        file_path = str(safe_filename)
+        original_filename = document.file_name
+        safe_filename = os.path.basename(original_filename)
 
-        # Скачиваем файл
-        await file.download_to_drive(file_path)
-        logger.info(f"Файл {safe_filename} сохранен в {file_path}")
+        # S3 клиент общий для всех сообщений
+        uploader = get_uploader()
 
-        await update.message.reply_text(f"Файл получен. Начинаю обработку...")
+        # Скачиваем файл в буфер (на диск он попадает, только если больше SPOOL_MAX_SIZE)
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as buffer:
+            await file.download_to_memory(out=buffer)
+            buffer.seek(0)
+            logger.info("Файл %s получен", safe_filename)
 
-        # Инициализируем S3 клиент
-        s3_config = S3Config(
-            key_id=os.getenv("KEY_ID"),
-            key_secret=os.getenv("KEY_SECRET"),
-            upload_bucket_name=os.getenv("UPLOAD_BUCKET_NAME"),
-        )
+            await message.reply_text(f"Файл получен. Начинаю обработку...")
 
-        uploader = S3Client(s3_config, logger)
-
-        # Загружаем файл в S3
-        uploader.upload_file("source-documents", file_path)
+            # Загружаем файл в S3 в отдельном потоке, не блокируя цикл событий
+            await asyncio.to_thread(
+                uploader.upload_fileobj, "source-documents", buffer, safe_filename
+            )
 
         # Ожидаем результат
         text = await wait_for_file_and_get_response(
             uploader, f"reports/report_{safe_filename}.json"
         )
 
-        await update.message.reply_text(text, reply_to_message_id=update.message.id)
-
-        # Опционально удаляем локальный файл после обработки
-        os.remove(file_path)
-        logger.info(f"Локальный файл {file_path} удален")
+        await message.reply_text(text, reply_to_message_id=message.id)
 
     except Exception as e:
-        logger.error(f"Ошибка при обработке документа: {e}")
-        await update.message.reply_text(
+        logger.exception("Ошибка при обработке документа: %s", e)
+        await message.reply_text(
             f"Произошла ошибка при обработке файла: {str(e)}"
         )
 
@@ -210,8 +290,14 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
 def Main():
     load_dotenv()
 
-    # Создаем приложение
-    application = Application.builder().token(os.getenv("BOT_TOKEN")).build()
+    # Создаем приложение; обновления обрабатываются параллельно, чтобы
+    # ожидание отчёта по одному файлу не задерживало остальные
+    application = (
+        Application.builder()
+        .token(os.getenv("BOT_TOKEN"))
+        .concurrent_updates(MAX_CONCURRENT_UPDATES)
+        .build()
+    )
 
     # Регистрируем обработчики
     application.add_handler(MessageHandler(filters.Document.PDF, handle_document))
@@ -2,6 +2,18 @@ import boto3
 import json
 from botocore.client import Config
 
+# Клиент S3 создаётся при загрузке модуля и переиспользуется тёплыми вызовами функции
+session = boto3.session.Session()
+s3 = session.client(
+    's3',
+    endpoint_url='https://storage.yandexcloud.net',
+    region_name='ru-central1',
+    config=Config(
+        signature_version='s3v4',
+        retries={'mode': 'adaptive', 'max_attempts': 10}
+    )
+)
+
 def handler(event, context):
     # Получаем параметры из тела запроса
     try:
@@ -14,15 +26,6 @@ def handler(event, context):
             'body': json.dumps({'error': 'Invalid request'})
         }
 
-    # Настраиваем клиент S3
-    session = boto3.session.Session()
-    s3 = session.client(
-        's3',
-        endpoint_url='https://storage.yandexcloud.net',
-        region_name='ru-central1',
-        config=Config(signature_version='s3v4')
-    )
-
     try:
         s3.delete_object(Bucket=bucket, Key=key)
         return {
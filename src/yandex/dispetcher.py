@@ -1,19 +1,44 @@
 import os
 import json
+import time
 import requests
 from urllib.parse import urljoin
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Общая HTTP-сессия: соединения (TLS) переиспользуются между запросами и тёплыми
+# вызовами функции; временные сбои идемпотентных запросов повторяются с задержкой
+http_session = requests.Session()
+_adapter = HTTPAdapter(max_retries=Retry(
+    total=3, backoff_factor=0.2,
+    status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False
+))
+http_session.mount("https://", _adapter)
+http_session.mount("http://", _adapter)
 
 # Константы
 FINANCIAL_FUNCTION_URL = "https://functions.yandexcloud.net/d4e92iv3g1msf6oc6356"
 SCRIPT_FUNCTION_URL = "https://functions.yandexcloud.net/d4e5dvrvl4oe4thursdv"
+FINANCIAL_EXTENSIONS = frozenset({'xlsx', 'xls'})
+
+# IAM-токен переиспользуется тёплыми вызовами функции, пока не истечёт его срок
+TOKEN_REFRESH_MARGIN = 60  # секунд до истечения, когда токен запрашивается заново
+_iam_token = None
+_iam_token_expires_at = 0.0
 
 def get_iam_token():
     """Получение IAM-токена из метаданных функции."""
+    global _iam_token, _iam_token_expires_at
+    if _iam_token and time.monotonic() < _iam_token_expires_at:
+        return _iam_token
     url = "http://169.254.169.254/computeMetadata/v1/instance/service-accounts/default/token"
     headers = {"Metadata-Flavor": "Google"}
-    resp = requests.get(url, headers=headers, timeout=3)
+    resp = http_session.get(url, headers=headers, timeout=3)
     resp.raise_for_status()
-    return resp.json()["access_token"]
+    payload = resp.json()
+    _iam_token = payload["access_token"]
+    _iam_token_expires_at = time.monotonic() + payload.get("expires_in", 0) - TOKEN_REFRESH_MARGIN
+    return _iam_token
 
 def handler(event, context):
     # Логируем входящее событие
@@ -21,8 +46,9 @@ def handler(event, context):
 
     # Извлекаем данные из события триггера
     try:
-        bucket = event['messages'][0]['details']['bucket_id']
-        object_key = event['messages'][0]['details']['object_id']
+        details = event['messages'][0]['details']
+        bucket = details['bucket_id']
+        object_key = details['object_id']
     except (KeyError, IndexError) as e:
         print(f"Failed to parse event: {e}")
         return {
@@ -30,16 +56,17 @@ def handler(event, context):
             'body': json.dumps({'status': 'error', 'reason': 'Invalid event format'})
         }
 
-    print(f"Processing file: {object_key} from bucket {bucket}")
-
     # Определяем тип файла по расширению
-    ext = object_key.split('.')[-1].lower()
-    if ext in ['xlsx', 'xls']:
+    ext = object_key.rpartition('.')[2].lower()
+    if ext in FINANCIAL_EXTENSIONS:
         target_url = FINANCIAL_FUNCTION_URL
-        print(f"Financial file detected -> calling {target_url}")
+        file_kind = "Financial"
     else:
         target_url = SCRIPT_FUNCTION_URL
-        print(f"Script file detected -> calling {target_url}")
+        file_kind = "Script"
+    # Одна запись в лог вместо нескольких print на каждый файл
+    print(f"Processing file: {object_key} from bucket {bucket}\n"
+          f"{file_kind} file detected -> calling {target_url}")
 
     # Получаем IAM-токен для вызова целевой функции
     try:
@@ -62,9 +89,9 @@ def handler(event, context):
     }
 
     try:
-        response = requests.post(target_url, json=payload, headers=headers, timeout=55)
-        print(f"Target function responded with status {response.status_code}")
-        print(f"Response body: {response.text}")
+        response = http_session.post(target_url, json=payload, headers=headers, timeout=55)
+        print(f"Target function responded with status {response.status_code}\n"
+              f"Response body: {response.text}")
 
         # Возвращаем ответ целевой функции
         return {
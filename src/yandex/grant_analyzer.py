@@ -4,6 +4,20 @@ import PyPDF2
 import io
 import urllib.parse
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Общая HTTP-сессия: соединения (TLS) переиспользуются между запросами и тёплыми
+# вызовами функции; временные сбои идемпотентных запросов повторяются с задержкой
+http_session = requests.Session()
+_adapter = HTTPAdapter(max_retries=Retry(
+    total=3, backoff_factor=0.2,
+    status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False
+))
+http_session.mount("https://", _adapter)
+http_session.mount("http://", _adapter)
 
 # Константы
 SOURCE_BUCKET = "source-documents"
@@ -13,6 +27,7 @@ REPORT_FOLDER = "reports"
 FOLDER_ID = "b1gjmkcodo66d40u8p9k"  # Ваш folder_id
 
 STORAGE_URL = "https://storage.yandexcloud.net"
+SCRIPT_EXTENSIONS = frozenset({'pdf', 'txt'})
 
 # Список ключевых слов для дополнительной проверки (можно расширять)
 ALCOHOL_KEYWORDS = [
@@ -20,14 +35,44 @@ ALCOHOL_KEYWORDS = [
     "напиток", "выпил", "глоток", "опьянеть", "бутылка", "налить",
     "средство от ломоты", "яд лютый", "для суставов", "перцу переложила"
 ]
+# Одно регулярное выражение на все слова: текст просматривается за один проход
+ALCOHOL_PATTERN = re.compile("|".join(re.escape(k) for k in ALCOHOL_KEYWORDS), re.IGNORECASE)
+
+# Запрос к YandexGPT; текст сценария дописывается в конец промпта
+GPT_URL = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+PROMPT_PREFIX = """
+Ты — эксперт по проверке сценариев на соответствие моральным ценностям РФ.
+Проанализируй текст сценария и верни результат строго в формате JSON:
+{
+  "theme": "краткая тема сценария (до 5 слов)",
+  "status": "accepted" или "rejected",
+  "violations": [
+    {"type": "нецензурная лексика", "quote": "цитата из текста"},
+    ...
+  ]
+}
+Если нарушений нет, поле violations должно быть пустым списком.
+Текст сценария:
+"""
+
+# IAM-токен переиспользуется тёплыми вызовами функции, пока не истечёт его срок
+TOKEN_REFRESH_MARGIN = 60  # секунд до истечения, когда токен запрашивается заново
+_iam_token = None
+_iam_token_expires_at = 0.0
 
 def get_iam_token():
     """Получает IAM-токен из метаданных функции."""
+    global _iam_token, _iam_token_expires_at
+    if _iam_token and time.monotonic() < _iam_token_expires_at:
+        return _iam_token
     url = "http://169.254.169.254/computeMetadata/v1/instance/service-accounts/default/token"
     headers = {"Metadata-Flavor": "Google"}
-    resp = requests.get(url, headers=headers)
+    resp = http_session.get(url, headers=headers)
     if resp.status_code == 200:
-        return resp.json()["access_token"]
+        payload = resp.json()
+        _iam_token = payload["access_token"]
+        _iam_token_expires_at = time.monotonic() + payload.get("expires_in", 0) - TOKEN_REFRESH_MARGIN
+        return _iam_token
     else:
         raise Exception("Не удалось получить IAM-токен")
 
@@ -38,7 +83,7 @@ def storage_request(method, bucket, key, token, data=None, content_type=None):
     headers = {"Authorization": f"Bearer {token}"}
     if content_type:
         headers["Content-Type"] = content_type
-    resp = requests.request(method, url, headers=headers, data=data)
+    resp = http_session.request(method, url, headers=headers, data=data)
     resp.raise_for_status()
     return resp
 
@@ -61,19 +106,17 @@ def check_additional_violations(text):
     """
     violations = []
     # Проверка на алкоголь
-    for keyword in ALCOHOL_KEYWORDS:
-        pattern = re.compile(re.escape(keyword), re.IGNORECASE)
-        match = pattern.search(text)
-        if match:
-            # Извлекаем предложение или фрагмент вокруг совпадения (можно улучшить)
-            start = max(0, match.start() - 30)
-            end = min(len(text), match.end() + 30)
-            quote = text[start:end].strip()
-            violations.append({
-                "type": "упоминание алкоголя",
-                "quote": quote
-            })
-            break  # Достаточно одного совпадения, но можно собирать все
+    match = ALCOHOL_PATTERN.search(text)
+    if match:
+        # Извлекаем предложение или фрагмент вокруг совпадения (можно улучшить)
+        start = max(0, match.start() - 30)
+        end = min(len(text), match.end() + 30)
+        quote = text[start:end].strip()
+        violations.append({
+            "type": "упоминание алкоголя",
+            "quote": quote
+        })
+        # Достаточно одного совпадения, но можно собирать все
     # Здесь можно добавить проверки на курение, наркотики и т.д.
     return violations
 
@@ -83,22 +126,7 @@ def analyze_with_yandexgpt(text, folder_id, token):
     Затем применяет дополнительную проверку на ключевые слова.
     Возвращает словарь с полями theme, status, violations (уже объединёнными).
     """
-    prompt = f"""
-Ты — эксперт по проверке сценариев на соответствие моральным ценностям РФ.
-Проанализируй текст сценария и верни результат строго в формате JSON:
-{{
-  "theme": "краткая тема сценария (до 5 слов)",
-  "status": "accepted" или "rejected",
-  "violations": [
-    {{"type": "нецензурная лексика", "quote": "цитата из текста"}},
-    ...
-  ]
-}}
-Если нарушений нет, поле violations должно быть пустым списком.
-Текст сценария:
-{text[:6000]}
-"""
-    url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+    prompt = PROMPT_PREFIX + text[:6000] + "\n"
     headers = {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json"
@@ -115,7 +143,7 @@ def analyze_with_yandexgpt(text, folder_id, token):
             {"role": "user", "text": prompt}
         ]
     }
-    resp = requests.post(url, headers=headers, json=data)
+    resp = http_session.post(GPT_URL, headers=headers, json=data)
     if resp.status_code == 200:
         result = resp.json()
         answer = result["result"]["alternatives"][0]["message"]["text"].strip()
@@ -151,9 +179,9 @@ def handler(event, context):
 
     # Разбираем событие от триггера
     try:
-        message = event['messages'][0]
-        bucket_id = message['details']['bucket_id']
-        object_key = message['details']['object_id']
+        details = event['messages'][0]['details']
+        bucket_id = details['bucket_id']
+        object_key = details['object_id']
     except Exception as e:
         print(f"Ошибка разбора event: {e}")
         return {'statusCode': 400, 'body': 'Bad Request'}
@@ -170,18 +198,17 @@ def handler(event, context):
         return {'statusCode': 500, 'body': f'Download Error: {e}'}
 
     # Определяем тип файла по расширению
-    ext = object_key.split('.')[-1].lower()
-    is_script = ext in ['pdf', 'txt']
+    ext = object_key.rpartition('.')[2].lower()
+    is_script = ext in SCRIPT_EXTENSIONS
 
     if is_script and ext == 'pdf':
         # Извлекаем текст из PDF
         text = ""
         try:
             pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
+            # Собираем страницы одним join, без копирования текста на каждой странице
+            page_texts = (page.extract_text() for page in pdf_reader.pages)
+            text = "".join(page_text + "\n" for page_text in page_texts if page_text)
         except Exception as e:
             text = ""
             reason = f"Ошибка извлечения текста: {e}"
@@ -202,10 +229,9 @@ def handler(event, context):
                 else:
                     status = "error"
                     # Формируем описание нарушений с цитатами
-                    violations_list = []
-                    for v in analysis["violations"]:
-                        violations_list.append(f"{v['type']}: «{v['quote']}»")
-                    reason = "Обнаружены нарушения:\n" + "\n".join(violations_list)
+                    reason = "Обнаружены нарушения:\n" + "\n".join(
+                        f"{v['type']}: «{v['quote']}»" for v in analysis["violations"]
+                    )
                     report_text = ""
             except Exception as e:
                 status = "error"
@@ -227,18 +253,25 @@ def handler(event, context):
             "status": "error",
             "reason": reason
         }, ensure_ascii=False).encode('utf-8')
+        # Отчёт и копия исходного файла не зависят друг от друга,
+        # поэтому загружаем их в карантин параллельно
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            report_future = executor.submit(
+                storage_request, 'PUT', QUARANTINE_BUCKET, f"{REPORT_FOLDER}/{report_name}",
+                iam_token, data=report_body, content_type='application/json')
+            copy_future = executor.submit(
+                storage_request, 'PUT', QUARANTINE_BUCKET, object_key,
+                iam_token, data=file_content, content_type='application/pdf')
+
         try:
-            storage_request('PUT', QUARANTINE_BUCKET, f"{REPORT_FOLDER}/{report_name}",
-                            iam_token, data=report_body, content_type='application/json')
+            report_future.result()
             print(f"Отчёт об ошибке загружен в {QUARANTINE_BUCKET}")
         except Exception as e:
             print(f"Ошибка загрузки отчёта об ошибке: {e}")
             return {'statusCode': 500, 'body': 'Report Upload Error'}
 
-        # Копируем исходный файл в карантин
         try:
-            storage_request('PUT', QUARANTINE_BUCKET, object_key,
-                            iam_token, data=file_content, content_type='application/pdf')
+            copy_future.result()
             print(f"Исходный файл скопирован в карантин")
         except Exception as e:
             print(f"Ошибка копирования файла в карантин: {e}")
@@ -4,6 +4,20 @@ import PyPDF2
 import io
 import urllib.parse
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Общая HTTP-сессия: соединения (TLS) переиспользуются между запросами и тёплыми
+# вызовами функции; временные сбои идемпотентных запросов повторяются с задержкой
+http_session = requests.Session()
+_adapter = HTTPAdapter(max_retries=Retry(
+    total=3, backoff_factor=0.2,
+    status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False
+))
+http_session.mount("https://", _adapter)
+http_session.mount("http://", _adapter)
 
 # Константы
 SOURCE_BUCKET = "source-documents"
@@ -25,13 +39,51 @@ BANNED_KEYWORDS = [
     # Нецензурная лексика (простые варианты, можно дополнить)
     "ёпрст", "хрен", "дурак", "идиот"
 ]
+# Одно регулярное выражение на все слова: текст просматривается за один проход
+BANNED_PATTERN = re.compile("|".join(re.escape(k) for k in BANNED_KEYWORDS), re.IGNORECASE)
+
+# Запрос к YandexGPT; текст сценария дописывается в конец промпта
+GPT_URL = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+PROMPT_PREFIX = """
+Ты — эксперт отдела контроля контента анимационной студии. Твоя задача — проверить предоставленный текст (сценарий мультфильма) на соответствие законодательству РФ и правилам платформы.
+
+Критерии проверки:
+- Пропаганда деструктивного поведения: сцены, демонстрирующие опасный для жизни образ действий без последствий, если это не является частью поучительной истории.
+- Дети должны видеть в мультфильме настоящие жизненные ситуации, эмоции, взаимоотношения (включая дружбу, ссоры, грусть, преодоление трудностей). Это нормально.
+- Недопустима «жесть»: сцены жестокости, физического насилия, крови, ужасов, издевательств, опасных действий без последствий, которые могут травмировать или напугать ребёнка.
+- Запрещены: сцены употребления алкоголя, табака, наркотиков; любые сексуальные намёки; нецензурная лексика и оскорбления.
+
+Инструкция:
+1. Прочитай сценарий.
+2. Если в нём есть нарушения по пунктам «жесть» или прямые запрещённые сцены (алкоголь, секс, мат и т.п.) — вынеси вердикт «Не принят».
+3. Если сценарий содержит жизненные ситуации, конфликты или эмоции, но без жестокости и запрещённых элементов — вердикт «Принят».
+4. Если встречается сцена, где показано опасное поведение (например, герой лезет на крышу), но при этом явно показаны последствия или это осуждается — это допустимо как жизненный урок, нарушения нет.
+
+Формат вывода (строго соблюдай структуру):
+Вердикт: [Принят / Не принят]
+Тематика: *[если Принят, кратко о чем мультфильм, 1 предложение]*
+Нарушение: [если Не принят, точная цитата и тип нарушения; иначе оставь пусто]
+
+Текст сценария:
+"""
+
+# IAM-токен переиспользуется тёплыми вызовами функции, пока не истечёт его срок
+TOKEN_REFRESH_MARGIN = 60  # секунд до истечения, когда токен запрашивается заново
+_iam_token = None
+_iam_token_expires_at = 0.0
 
 def get_iam_token():
+    global _iam_token, _iam_token_expires_at
+    if _iam_token and time.monotonic() < _iam_token_expires_at:
+        return _iam_token
     url = "http://169.254.169.254/computeMetadata/v1/instance/service-accounts/default/token"
     headers = {"Metadata-Flavor": "Google"}
-    resp = requests.get(url, headers=headers)
+    resp = http_session.get(url, headers=headers)
     if resp.status_code == 200:
-        return resp.json()["access_token"]
+        payload = resp.json()
+        _iam_token = payload["access_token"]
+        _iam_token_expires_at = time.monotonic() + payload.get("expires_in", 0) - TOKEN_REFRESH_MARGIN
+        return _iam_token
     else:
         raise Exception("Не удалось получить IAM-токен")
 
@@ -41,55 +93,28 @@ def storage_request(method, bucket, key, token, data=None, content_type=None):
     headers = {"Authorization": f"Bearer {token}"}
     if content_type:
         headers["Content-Type"] = content_type
-    resp = requests.request(method, url, headers=headers, data=data)
+    resp = http_session.request(method, url, headers=headers, data=data)
     resp.raise_for_status()
     return resp
 
 def check_banned_keywords(text):
     """Проверяет текст на наличие запрещённых ключевых слов."""
     violations = []
-    for keyword in BANNED_KEYWORDS:
-        pattern = re.compile(re.escape(keyword), re.IGNORECASE)
-        match = pattern.search(text)
-        if match:
-            start = max(0, match.start() - 30)
-            end = min(len(text), match.end() + 30)
-            quote = text[start:end].strip()
-            violations.append({
-                "keyword": keyword,
-                "quote": quote
-            })
-            # Можно добавить все, но для первого достаточно
-            return violations
+    match = BANNED_PATTERN.search(text)
+    if match:
+        start = max(0, match.start() - 30)
+        end = min(len(text), match.end() + 30)
+        quote = text[start:end].strip()
+        violations.append({
+            "keyword": match.group(0).lower(),
+            "quote": quote
+        })
+        # Можно добавить все, но для первого достаточно
     return violations
 
 def analyze_with_yandexgpt(text, folder_id, token):
-    prompt_template = """
-Ты — эксперт отдела контроля контента анимационной студии. Твоя задача — проверить предоставленный текст (сценарий мультфильма) на соответствие законодательству РФ и правилам платформы.
-
-Критерии проверки:
-- Пропаганда деструктивного поведения: сцены, демонстрирующие опасный для жизни образ действий без последствий, если это не является частью поучительной истории.
-- Дети должны видеть в мультфильме настоящие жизненные ситуации, эмоции, взаимоотношения (включая дружбу, ссоры, грусть, преодоление трудностей). Это нормально.
-- Недопустима «жесть»: сцены жестокости, физического насилия, крови, ужасов, издевательств, опасных действий без последствий, которые могут травмировать или напугать ребёнка.
-- Запрещены: сцены употребления алкоголя, табака, наркотиков; любые сексуальные намёки; нецензурная лексика и оскорбления.
+    prompt = PROMPT_PREFIX + text[:6000] + "\n"
 
-Инструкция:
-1. Прочитай сценарий.
-2. Если в нём есть нарушения по пунктам «жесть» или прямые запрещённые сцены (алкоголь, секс, мат и т.п.) — вынеси вердикт «Не принят».
-3. Если сценарий содержит жизненные ситуации, конфликты или эмоции, но без жестокости и запрещённых элементов — вердикт «Принят».
-4. Если встречается сцена, где показано опасное поведение (например, герой лезет на крышу), но при этом явно показаны последствия или это осуждается — это допустимо как жизненный урок, нарушения нет.
-
-Формат вывода (строго соблюдай структуру):
-Вердикт: [Принят / Не принят]
-Тематика: *[если Принят, кратко о чем мультфильм, 1 предложение]*
-Нарушение: [если Не принят, точная цитата и тип нарушения; иначе оставь пусто]
-
-Текст сценария:
-{}
-"""
-    prompt = prompt_template.format(text[:6000])
-
-    url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
     headers = {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json"
@@ -106,7 +131,7 @@ def analyze_with_yandexgpt(text, folder_id, token):
             {"role": "user", "text": prompt}
         ]
     }
-    resp = requests.post(url, headers=headers, json=data)
+    resp = http_session.post(GPT_URL, headers=headers, json=data)
     if resp.status_code == 200:
         result = resp.json()
         answer = result["result"]["alternatives"][0]["message"]["text"].strip()
@@ -122,11 +147,12 @@ def parse_gpt_response(response):
     quote = ""
     for line in lines:
         line = line.strip()
-        if line.lower().startswith("вердикт:"):
-            verdict = line[8:].strip().lower()
-        elif line.lower().startswith("тематика:"):
+        lowered = line.lower()
+        if lowered.startswith("вердикт:"):
+            verdict = lowered[8:].strip()
+        elif lowered.startswith("тематика:"):
             theme = line[9:].strip()
-        elif line.lower().startswith("нарушение:"):
+        elif lowered.startswith("нарушение:"):
             quote = line[10:].strip()
     return verdict, theme, quote
 
@@ -139,9 +165,9 @@ def handler(event, context):
 
     # Разбираем событие
     try:
-        message = event['messages'][0]
-        bucket_id = message['details']['bucket_id']
-        object_key = message['details']['object_id']
+        details = event['messages'][0]['details']
+        bucket_id = details['bucket_id']
+        object_key = details['object_id']
     except Exception as e:
         print(f"Ошибка разбора event: {e}")
         return {'statusCode': 400, 'body': 'Bad Request'}
@@ -158,15 +184,14 @@ def handler(event, context):
         return {'statusCode': 500, 'body': f'Download Error: {e}'}
 
     # Извлекаем текст
-    ext = object_key.split('.')[-1].lower()
+    ext = object_key.rpartition('.')[2].lower()
     text = ""
     try:
         if ext == 'pdf':
             pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
+            # Собираем страницы одним join, без копирования текста на каждой странице
+            page_texts = (page.extract_text() for page in pdf_reader.pages)
+            text = "".join(page_text + "\n" for page_text in page_texts if page_text)
         elif ext == 'txt':
             text = file_content.decode('utf-8', errors='ignore')
         else:
@@ -228,18 +253,25 @@ def handler(event, context):
             "status": "error",
             "reason": reason
         }, ensure_ascii=False).encode('utf-8')
+        # Отчёт и копия исходного файла не зависят друг от друга,
+        # поэтому загружаем их в карантин параллельно
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            report_future = executor.submit(
+                storage_request, 'PUT', QUARANTINE_BUCKET, f"{REPORT_FOLDER}/{report_name}",
+                iam_token, data=report_body, content_type='application/json')
+            copy_future = executor.submit(
+                storage_request, 'PUT', QUARANTINE_BUCKET, object_key,
+                iam_token, data=file_content, content_type='application/octet-stream')
+
         try:
-            storage_request('PUT', QUARANTINE_BUCKET, f"{REPORT_FOLDER}/{report_name}",
-                            iam_token, data=report_body, content_type='application/json')
+            report_future.result()
             print(f"Отчёт об ошибке загружен в {QUARANTINE_BUCKET}")
         except Exception as e:
             print(f"Ошибка загрузки отчёта об ошибке: {e}")
             return {'statusCode': 500, 'body': 'Report Upload Error'}
 
-        # Копируем исходный файл в карантин
         try:
-            storage_request('PUT', QUARANTINE_BUCKET, object_key,
-                            iam_token, data=file_content, content_type='application/octet-stream')
+            copy_future.result()
             print(f"Исходный файл скопирован в карантин")
         except Exception as e:
             print(f"Ошибка копирования файла в карантин: {e}")
@@ -1,5 +1,17 @@
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Общая HTTP-сессия: соединения (TLS) переиспользуются между запросами и тёплыми
+# вызовами функции; временные сбои идемпотентных запросов повторяются с задержкой
+http_session = requests.Session()
+_adapter = HTTPAdapter(max_retries=Retry(
+    total=3, backoff_factor=0.2,
+    status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False
+))
+http_session.mount("https://", _adapter)
+http_session.mount("http://", _adapter)
 
 WORKFLOW_ID = "dfqneb50q7h1sn95cc2f"   # скопируйте из консоли Workflows
 FOLDER_ID = "b1gjmkcodo66d40u8p9k"     # ваш folder_id
@@ -28,7 +40,7 @@ def handler(event, context):
     
     print("Отправка запроса к API...")
     try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=10)
+        resp = http_session.post(url, headers=headers, json=payload, timeout=10)
         print("Статус ответа:", resp.status_code)
         print("Тело ответа:", resp.text)
         if resp.status_code == 200: